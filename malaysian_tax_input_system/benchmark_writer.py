@@ -0,0 +1,78 @@
+"""
+Compare sequential CSV writes with BatchedCSVWriter.
+
+Each simulated session registers a user and then updates their record,
+all sessions running at once. Usage: python benchmark_writer.py [sessions]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import functions as fn
+
+
+def make_row(user_id, income=0.0):
+    return {
+        'user_id': user_id,
+        'ic_number': '010101020303',
+        'annual_income': income,
+        'tax_relief': 0.0,
+        'tax_payable': 0.0
+    }
+
+
+def run_sequential(sessions, filename):
+    """Each session calls save_to_csv and update_user_record directly."""
+    def session(i):
+        fn.save_to_csv(make_row(f'u{i}'), filename)
+        fn.update_user_record(f'u{i}', make_row(f'u{i}', float(i)), filename)
+
+    return run_sessions(sessions, session)
+
+
+def run_batched(sessions, filename):
+    """Each session submits to a shared BatchedCSVWriter."""
+    with fn.BatchedCSVWriter(filename) as writer:
+        def session(i):
+            writer.submit_registration(make_row(f'u{i}')).result()
+            writer.submit_update(f'u{i}', make_row(f'u{i}', float(i))).result()
+
+        return run_sessions(sessions, session)
+
+
+def run_sessions(sessions, session):
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sequential_file = os.path.join(tmp_dir, "sequential.csv")
+        batched_file = os.path.join(tmp_dir, "batched.csv")
+
+        sequential_time = run_sequential(sessions, sequential_file)
+        batched_time = run_batched(sessions, batched_file)
+
+        # Both runs must end with the same records
+        sequential_df = fn.read_from_csv(sequential_file).sort_values('user_id')
+        batched_df = fn.read_from_csv(batched_file).sort_values('user_id')
+        same = sequential_df.reset_index(drop=True).equals(batched_df.reset_index(drop=True))
+
+    print(f"Sessions:    {sessions}")
+    print(f"Sequential:  {sequential_time:.2f}s ({2 * sessions / sequential_time:,.0f} writes/s)")
+    print(f"Batched:     {batched_time:.2f}s ({2 * sessions / batched_time:,.0f} writes/s)")
+    print(f"Speedup:     {sequential_time / batched_time:.1f}x")
+    print(f"Same CSV:    {same}")
+
+
+if __name__ == "__main__":
+    main()
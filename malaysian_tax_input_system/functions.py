@@ -1,5 +1,30 @@
+import numpy as np
 import pandas as pd
 import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Malaysian tax brackets (Latest 2024/2025): (category, lower, upper, rate)
+TAX_BRACKETS = [
+    ('A', 0, 5000, 0.00),
+    ('B', 5000, 20000, 0.01),
+    ('C', 20000, 35000, 0.03),
+    ('D', 35000, 50000, 0.06),
+    ('E', 50000, 70000, 0.11),
+    ('F', 70000, 100000, 0.19),
+    ('G', 100000, 400000, 0.25),
+    ('H', 400000, 600000, 0.26),
+    ('I', 600000, 2000000, 0.28),
+    ('J', 2000000, float('inf'), 0.30),
+]
 
 def verify_user(ic_number, password):
     """
@@ -27,17 +52,8 @@ def calculate_tax(income, tax_relief):
     """
     Calculate tax payable based on Malaysian tax rates (Latest 2024/2025).
     
-    Tax Brackets:
-    Category A: RM 0 - 5,000 @ 0% = RM 0
-    Category B: RM 5,001 - 20,000 @ 1% = RM 150
-    Category C: RM 20,001 - 35,000 @ 3% = RM 450
-    Category D: RM 35,001 - 50,000 @ 6% = RM 900
-    Category E: RM 50,001 - 70,000 @ 11% = RM 2,200
-    Category F: RM 70,001 - 100,000 @ 19% = RM 5,700
-    Category G: RM 100,001 - 400,000 @ 25% = RM 75,000
-    Category H: RM 400,001 - 600,000 @ 26% = RM 52,000
-    Category I: RM 600,001 - 2,000,000 @ 28% = RM 392,000
-    Category J: Exceeding RM 2,000,000 @ 30%
+    The tax brackets are defined in TAX_BRACKETS. The result always equals
+    the tax_payable of calculate_tax_breakdown().
     """
     # Calculate chargeable income
     chargeable_income = income - tax_relief
@@ -46,41 +62,183 @@ def calculate_tax(income, tax_relief):
     if chargeable_income <= 0:
         return 0.0
     
-    # Progressive tax calculation based on latest rates
-    tax = 0.0
-    
-    if chargeable_income <= 5000:
-        # Category A: 0% on first RM 5,000
-        tax = 0
-    elif chargeable_income <= 20000:
-        # Category B: 1% on next RM 15,000
-        tax = 0 + (chargeable_income - 5000) * 0.01
-    elif chargeable_income <= 35000:
-        # Category C: 3% on next RM 15,000
-        tax = 150 + (chargeable_income - 20000) * 0.03
-    elif chargeable_income <= 50000:
-        # Category D: 6% on next RM 15,000
-        tax = 150 + 450 + (chargeable_income - 35000) * 0.06
-    elif chargeable_income <= 70000:
-        # Category E: 11% on next RM 20,000
-        tax = 150 + 450 + 900 + (chargeable_income - 50000) * 0.11
-    elif chargeable_income <= 100000:
-        # Category F: 19% on next RM 30,000
-        tax = 150 + 450 + 900 + 2200 + (chargeable_income - 70000) * 0.19
-    elif chargeable_income <= 400000:
-        # Category G: 25% on next RM 300,000
-        tax = 150 + 450 + 900 + 2200 + 5700 + (chargeable_income - 100000) * 0.25
-    elif chargeable_income <= 600000:
-        # Category H: 26% on next RM 200,000
-        tax = 150 + 450 + 900 + 2200 + 5700 + 75000 + (chargeable_income - 400000) * 0.26
-    elif chargeable_income <= 2000000:
-        # Category I: 28% on next RM 1,400,000
-        tax = 150 + 450 + 900 + 2200 + 5700 + 75000 + 52000 + (chargeable_income - 600000) * 0.28
+    _, tax_payable = _tax_by_bracket(np.array([chargeable_income], dtype=float))
+    return float(tax_payable[0])
+
+
+def _tax_by_bracket(chargeable):
+    """
+    Calculate the tax in each bracket for an array of chargeable incomes.
+    
+    Returns:
+        tuple: (band_tax, tax_payable) where tax_payable is rounded to
+        2 decimals and band_tax has one column per bracket, also rounded
+        to 2 decimals and adding up exactly to tax_payable
+    """
+    lowers = np.array([lower for _, lower, _, _ in TAX_BRACKETS], dtype=float)
+    uppers = np.array([upper for _, _, upper, _ in TAX_BRACKETS], dtype=float)
+    rates = np.array([rate for _, _, _, rate in TAX_BRACKETS])
+    
+    # Tax on all brackets below each one (RM 0, 150, 600, 1,500, ...)
+    full_band_tax = np.round((uppers[:-1] - lowers[:-1]) * rates[:-1], 2)
+    tax_below = np.concatenate(([0.0], np.cumsum(full_band_tax)))
+    
+    # Bracket containing the chargeable income (upper limit inclusive)
+    band_index = np.searchsorted(uppers, chargeable, side='left')
+    tax = tax_below[band_index] + (chargeable - lowers[band_index]) * rates[band_index]
+    
+    # np.round can differ from round() next to a half cent, redo those with
+    # round() so the total matches calculate_tax's published figures exactly
+    tax_payable = np.round(tax, 2)
+    scaled = tax * 100
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    tax_payable[near_tie] = [round(float(t), 2) for t in tax[near_tie]]
+    
+    # Income falling in each bracket, one column per bracket
+    in_band = np.clip(chargeable[:, None] - lowers, 0.0, uppers - lowers)
+    band_tax = np.round(in_band * rates, 2)
+    
+    # Put any rounding difference on the bracket the income falls in
+    rows = np.arange(len(chargeable))
+    band_tax[rows, band_index] = 0.0
+    band_tax[rows, band_index] = np.round(tax_payable - band_tax.sum(axis=1), 2)
+    
+    return band_tax, tax_payable
+
+
+def calculate_tax_breakdown_batch(incomes, tax_reliefs):
+    """
+    Calculate the per-bracket tax breakdown for many filers in one pass.
+    
+    The marginal rate is the rate on the next RM of chargeable income, so
+    income exactly on a bracket limit (e.g. RM 20,000) gets the rate of the
+    bracket above it.
+    
+    Args:
+        incomes: Sequence of annual incomes
+        tax_reliefs: Sequence of total tax reliefs, same length as incomes
+    
+    Returns:
+        pd.DataFrame: One row per filer with columns chargeable_income,
+        tax_band_A to tax_band_J, tax_payable, effective_rate (tax payable
+        over chargeable income), marginal_rate and to_next_band (RM of
+        chargeable income until the next bracket starts, NaN in Category J)
+    """
+    categories = [category for category, _, _, _ in TAX_BRACKETS]
+    uppers = np.array([upper for _, _, upper, _ in TAX_BRACKETS], dtype=float)
+    rates = np.array([rate for _, _, _, rate in TAX_BRACKETS])
+    
+    chargeable = np.maximum(
+        np.asarray(incomes, dtype=float) - np.asarray(tax_reliefs, dtype=float), 0.0
+    )
+    band_tax, tax_payable = _tax_by_bracket(chargeable)
+    
+    # Bracket taxing the next RM of chargeable income
+    band_index = np.searchsorted(uppers, chargeable, side='right')
+    to_next_band = uppers[band_index] - chargeable
+    to_next_band[np.isinf(to_next_band)] = np.nan
+    
+    effective_rate = np.divide(
+        tax_payable, chargeable,
+        out=np.zeros_like(tax_payable), where=chargeable > 0
+    )
+    
+    breakdown = pd.DataFrame(band_tax, columns=[f'tax_band_{c}' for c in categories])
+    breakdown.insert(0, 'chargeable_income', chargeable)
+    breakdown['tax_payable'] = tax_payable
+    breakdown['effective_rate'] = np.round(effective_rate, 4)
+    breakdown['marginal_rate'] = rates[band_index]
+    breakdown['to_next_band'] = np.round(to_next_band, 2)
+    
+    return breakdown
+
+
+def calculate_tax_breakdown(income, tax_relief):
+    """
+    Calculate the per-bracket tax breakdown for a single filer.
+    
+    Returns:
+        dict: Same fields as a row of calculate_tax_breakdown_batch()
+    """
+    return calculate_tax_breakdown_batch([income], [tax_relief]).iloc[0].to_dict()
+
+
+@contextmanager
+def csv_lock(filename, shared=False):
+    """
+    Hold a lock on the CSV file across processes.
+    
+    The lock is taken on a sidecar "<filename>.lock" file because rewrites
+    replace the CSV file itself. Readers pass shared=True so they only wait
+    for writers. On Windows every lock is exclusive.
+    """
+    lock_file = open(filename + '.lock', 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after about 10 seconds, keep waiting
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        lock_file.close()
+
+
+def _append_rows(rows, filename):
+    """Append rows to the CSV file in one write, adding a header for a new file."""
+    df = pd.DataFrame(rows)
+    write_header = not os.path.exists(filename)
+    
+    if not write_header:
+        # Line the rows up with the existing header (e.g. breakdown columns)
+        columns = list(pd.read_csv(filename, nrows=0).columns)
+        if not set(df.columns) <= set(columns):
+            # New columns need a new header, so rewrite the whole file
+            _rewrite_csv(pd.concat([_read_csv(filename), df], ignore_index=True), filename)
+            return
+        df = df.reindex(columns=columns)
+    
+    with open(filename, 'a', newline='') as f:
+        df.to_csv(f, header=write_header, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _rewrite_csv(df, filename):
+    """Atomically replace the CSV file with the contents of df."""
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', newline='') as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def _apply_update(df, user_id, new_data):
+    """Update the user's row in df, appending a new row if not found."""
+    user_index = df[df['user_id'] == user_id].index
+    
+    if len(user_index) > 0:
+        # Update existing record
+        for key, value in new_data.items():
+            df.at[user_index[0], key] = value
     else:
-        # Category J: 30% on amount exceeding RM 2,000,000
-        tax = 150 + 450 + 900 + 2200 + 5700 + 75000 + 52000 + 392000 + (chargeable_income - 2000000) * 0.30
+        # User not found, this shouldn't happen but handle it
+        new_df = pd.DataFrame([new_data])
+        df = pd.concat([df, new_df], ignore_index=True)
     
-    return round(tax, 2)
+    return df
 
 
 def save_to_csv(data, filename):
@@ -89,16 +247,8 @@ def save_to_csv(data, filename):
     otherwise appends data to existing file.
     """
     try:
-        # Create DataFrame from data
-        df = pd.DataFrame([data])
-        
-        # Check if file exists
-        if os.path.exists(filename):
-            # Append to existing file without header
-            df.to_csv(filename, mode='a', header=False, index=False)
-        else:
-            # Create new file with header
-            df.to_csv(filename, mode='w', header=True, index=False)
+        with csv_lock(filename):
+            _append_rows([data], filename)
         
         return True
     except Exception as e:
@@ -106,17 +256,22 @@ def save_to_csv(data, filename):
         return False
 
 
+def _read_csv(filename):
+    """Read the CSV file without locking, returning None if it doesn't exist."""
+    if os.path.exists(filename):
+        # Read ic_number as string to preserve leading zeros
+        return pd.read_csv(filename, dtype={'ic_number': str})
+    return None
+
+
 def read_from_csv(filename):
     """
     Read data from CSV file and return as pandas DataFrame.
     """
     try:
-        if os.path.exists(filename):
-            # Read ic_number as string to preserve leading zeros
-            df = pd.read_csv(filename, dtype={'ic_number': str})
-            return df
-        else:
-            return None
+        # Wait for any write in progress so a partial row is never read
+        with csv_lock(filename, shared=True):
+            return _read_csv(filename)
     except Exception as e:
         print(f"Error reading CSV: {e}")
         return None
@@ -152,26 +307,18 @@ def update_user_record(user_id, new_data, filename):
         bool: True if successful, False otherwise
     """
     try:
-        df = read_from_csv(filename)
-        
-        if df is None:
-            # File doesn't exist, create new
-            return save_to_csv(new_data, filename)
-        
-        # Find the user's row
-        user_index = df[df['user_id'] == user_id].index
-        
-        if len(user_index) > 0:
-            # Update existing record
-            for key, value in new_data.items():
-                df.at[user_index[0], key] = value
-        else:
-            # User not found, this shouldn't happen but handle it
-            new_df = pd.DataFrame([new_data])
-            df = pd.concat([df, new_df], ignore_index=True)
-        
-        # Save back to CSV
-        df.to_csv(filename, index=False)
+        with csv_lock(filename):
+            df = _read_csv(filename)
+            
+            if df is None:
+                # File doesn't exist, create new
+                _append_rows([new_data], filename)
+                return True
+            
+            df = _apply_update(df, user_id, new_data)
+            
+            # Save back to CSV
+            _rewrite_csv(df, filename)
         return True
         
     except Exception as e:
@@ -179,6 +326,178 @@ def update_user_record(user_id, new_data, filename):
         return False
 
 
+def _write_batch(batch, filename):
+    """
+    Apply queued registrations and updates under one lock with one fsync.
+    
+    Args:
+        batch (list): (kind, user_id, data) tuples in submission order
+        filename (str): Name of CSV file
+    
+    Returns:
+        list: bool result for each item in batch
+    """
+    results = []
+    new_rows = []
+    updates = []
+    
+    with csv_lock(filename):
+        df = _read_csv(filename)
+        known_users = set() if df is None else set(df['user_id'])
+        
+        for kind, user_id, data in batch:
+            if kind == 'register':
+                # Reject duplicates, including ones from other processes
+                if user_id in known_users:
+                    results.append(False)
+                    continue
+                new_rows.append(data)
+            else:
+                updates.append((user_id, data))
+            known_users.add(user_id)
+            results.append(True)
+        
+        if not updates:
+            # Registrations only, append them in a single write
+            if new_rows:
+                _append_rows(new_rows, filename)
+            return results
+        
+        if df is None:
+            df = pd.DataFrame(new_rows)
+        elif new_rows:
+            df = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
+        
+        for user_id, data in updates:
+            if df.empty:
+                df = pd.DataFrame([data])
+            else:
+                df = _apply_update(df, user_id, data)
+        
+        _rewrite_csv(df, filename)
+    
+    return results
+
+
+class BatchedCSVWriter:
+    """
+    Queue registrations and updates and write them to the CSV file in batches.
+    
+    Pending items are flushed once max_batch items are queued or max_delay
+    seconds have passed since the oldest one, using a single locked write.
+    Each submit call returns a Future that resolves to True if the item was
+    saved, or False if it failed (e.g. a registration for an existing user).
+    Meant for hosts serving many sessions at once, a single interactive
+    session should call save_to_csv/update_user_record directly.
+    
+    Args:
+        filename (str): Name of CSV file
+        max_batch (int): Number of pending items that triggers a flush
+        max_delay (float): Seconds to wait for more items before flushing
+    """
+    
+    def __init__(self, filename, max_batch=64, max_delay=0.05):
+        self.filename = filename
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._first_queued = None
+        self._flush_count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def submit_registration(self, data):
+        """Queue a new user row. Returns a Future resolving to bool."""
+        return self._submit('register', data['user_id'], data)
+    
+    def submit_update(self, user_id, new_data):
+        """Queue an update of a user's row. Returns a Future resolving to bool."""
+        return self._submit('update', user_id, new_data)
+    
+    def flush(self):
+        """Write all pending items now and wait for them to complete."""
+        with self._condition:
+            futures = [future for _, future in self._pending]
+            # Drain everything queued so far without waiting for max_delay
+            self._flush_count = len(self._pending)
+            self._condition.notify()
+        for future in futures:
+            future.result()
+    
+    def close(self):
+        """Write all pending items and stop the background writer."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _submit(self, kind, user_id, data):
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchedCSVWriter is closed")
+            if not self._pending:
+                self._first_queued = time.monotonic()
+            self._pending.append(((kind, user_id, data), future))
+            # Wake the writer to start the batch window or flush a full batch
+            if len(self._pending) == 1 or len(self._pending) >= self.max_batch:
+                self._condition.notify()
+        return future
+    
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while True:
+                        if self._pending:
+                            wait = self._first_queued + self.max_delay - time.monotonic()
+                            if (self._closed or self._flush_count > 0
+                                    or len(self._pending) >= self.max_batch or wait <= 0):
+                                break
+                        elif self._closed:
+                            return
+                        else:
+                            wait = None
+                        self._condition.wait(wait)
+                    pending = self._pending[:self.max_batch]
+                    self._pending = self._pending[self.max_batch:]
+                    self._first_queued = time.monotonic() if self._pending else None
+                    self._flush_count = max(0, self._flush_count - len(pending))
+                
+                self._write_pending(pending)
+        finally:
+            # Never leave callers waiting if the writer stops unexpectedly
+            with self._condition:
+                self._closed = True
+                pending, self._pending = self._pending, []
+            for _, future in pending:
+                future.set_exception(RuntimeError("BatchedCSVWriter stopped"))
+    
+    def _write_pending(self, pending):
+        """Write one batch and resolve every future in it."""
+        try:
+            results = _write_batch([item for item, _ in pending], self.filename)
+            for (_, future), result in zip(pending, results):
+                future.set_result(result)
+        except Exception as e:
+            print(f"Error writing batch to CSV: {e}")
+            for _, future in pending:
+                if not future.done():
+                    future.set_result(False)
+        finally:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("BatchedCSVWriter stopped"))
+
+
 def validate_positive_number(value, field_name):
     """
     Validate that a value is a positive number.
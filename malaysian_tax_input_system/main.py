@@ -1,9 +1,14 @@
 import functions as fn
+import math
 import os
 
 # Constants
 CSV_FILENAME = "tax_records.csv"
 
+# Store the per-bracket tax breakdown with each tax record. There is no menu
+# option for this, set it here or pass save_breakdown to calculate_and_save_tax
+SAVE_TAX_BREAKDOWN = False
+
 # Tax relief limits (in RM)
 TAX_RELIEF_LIMITS = {
     "individual": 9000,
@@ -371,14 +376,19 @@ def get_tax_relief_input():
     return total_relief
 
 
-def calculate_and_save_tax(user_id, ic_number):
+def calculate_and_save_tax(user_id, ic_number, save_breakdown=None):
     """
     Main tax calculation workflow.
     
     Args:
         user_id (str): User's ID
         ic_number (str): User's IC number
+        save_breakdown (bool): Also save the per-bracket breakdown in the
+            record, defaults to SAVE_TAX_BREAKDOWN
     """
+    if save_breakdown is None:
+        save_breakdown = SAVE_TAX_BREAKDOWN
+    
     print("\n" + "="*60)
     print(" "*20 + "TAX CALCULATION")
     print("="*60)
@@ -396,7 +406,8 @@ def calculate_and_save_tax(user_id, ic_number):
     tax_relief = get_tax_relief_input()
     
     # Calculate tax
-    tax_payable = fn.calculate_tax(income, tax_relief)
+    breakdown = fn.calculate_tax_breakdown(income, tax_relief)
+    tax_payable = breakdown['tax_payable']
     
     # Display results
     print("\n" + "="*60)
@@ -404,8 +415,23 @@ def calculate_and_save_tax(user_id, ic_number):
     print("="*60)
     print(f"Annual Income:        RM {income:,.2f}")
     print(f"Total Tax Relief:     RM {tax_relief:,.2f}")
-    print(f"Chargeable Income:    RM {max(0, income - tax_relief):,.2f}")
+    print(f"Chargeable Income:    RM {breakdown['chargeable_income']:,.2f}")
     print(f"Tax Payable:          RM {tax_payable:,.2f}")
+    print("-"*60)
+    
+    # Display tax for each bracket the chargeable income reaches
+    for category, lower, upper, rate in fn.TAX_BRACKETS:
+        if breakdown['chargeable_income'] <= lower and lower > 0:
+            break
+        band_range = f"RM {lower:,} - {upper:,.0f}" if upper != float('inf') else f"Above RM {lower:,}"
+        print(f"Category {category} ({band_range} @ {rate:.0%})".ljust(45)
+              + f"RM {breakdown[f'tax_band_{category}']:>10,.2f}")
+    
+    print("-"*60)
+    print(f"Effective Tax Rate:   {breakdown['effective_rate']:.2%}")
+    print(f"Marginal Tax Rate:    {breakdown['marginal_rate']:.0%}")
+    if not math.isnan(breakdown['to_next_band']):
+        print(f"To Next Bracket:      RM {breakdown['to_next_band']:,.2f}")
     print("="*60)
     
     # Update user record in CSV
@@ -417,6 +443,9 @@ def calculate_and_save_tax(user_id, ic_number):
         'tax_payable': tax_payable
     }
     
+    if save_breakdown:
+        data.update(breakdown)
+    
     # Remove old record and add new one
     if fn.update_user_record(user_id, data, CSV_FILENAME):
         print("\n✓ Tax record saved successfully!")
@@ -0,0 +1,206 @@
+import math
+import random
+import time
+
+import pytest
+
+import functions as fn
+
+
+def make_row(user_id, income=0.0):
+    return {
+        'user_id': user_id,
+        'ic_number': '010101020303',
+        'annual_income': income,
+        'tax_relief': 0.0,
+        'tax_payable': 0.0
+    }
+
+
+@pytest.mark.parametrize("chargeable, expected", [
+    (0, 0.0),
+    (5000, 0.0),
+    (20000, 150.0),
+    (67500, 3425.0),
+    (100000, 9400.0),
+    (2500000, 678400.0),
+])
+def test_calculate_tax(chargeable, expected):
+    assert fn.calculate_tax(chargeable, 0) == expected
+
+
+def test_breakdown_matches_calculate_tax():
+    rng = random.Random(0)
+    incomes = [round(rng.uniform(0, 3000000), 2) for _ in range(10000)]
+    incomes += [lower for _, lower, _, _ in fn.TAX_BRACKETS]
+    reliefs = [round(rng.uniform(0, 30000), 2) for _ in incomes]
+
+    breakdown = fn.calculate_tax_breakdown_batch(incomes, reliefs)
+    band_columns = [f'tax_band_{c}' for c, _, _, _ in fn.TAX_BRACKETS]
+
+    for row, income, relief in zip(breakdown.itertuples(), incomes, reliefs):
+        assert row.tax_payable == fn.calculate_tax(income, relief)
+
+    # Displayed band amounts add up to the total to the cent
+    band_cents = (breakdown[band_columns] * 100).round().sum(axis=1)
+    assert (band_cents == (breakdown['tax_payable'] * 100).round()).all()
+
+
+@pytest.mark.parametrize("chargeable, expected", [
+    (219580.26, 39295.07),
+    (2286840.25, 614452.07),
+])
+def test_calculate_tax_half_cent_ties(chargeable, expected):
+    # Values from the original per-category calculation
+    assert fn.calculate_tax(chargeable, 0) == expected
+    assert fn.calculate_tax_breakdown(chargeable, 0)['tax_payable'] == expected
+
+
+@pytest.mark.parametrize("chargeable, marginal_rate, to_next_band", [
+    (0, 0.00, 5000.0),
+    (5000, 0.01, 15000.0),
+    (20000, 0.03, 15000.0),
+    (19999.5, 0.01, 0.5),
+    (2000000, 0.30, None),
+])
+def test_breakdown_marginal_rate(chargeable, marginal_rate, to_next_band):
+    breakdown = fn.calculate_tax_breakdown(chargeable, 0)
+    assert breakdown['marginal_rate'] == marginal_rate
+    if to_next_band is None:
+        assert math.isnan(breakdown['to_next_band'])
+    else:
+        assert breakdown['to_next_band'] == to_next_band
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    return str(tmp_path / "tax_records.csv")
+
+
+def test_append_follows_existing_header(csv_path):
+    assert fn.save_to_csv(make_row('alice'), csv_path)
+    breakdown = fn.calculate_tax_breakdown(90000, 22500)
+    assert fn.update_user_record('alice', {**make_row('alice', 90000.0), **breakdown}, csv_path)
+    assert fn.save_to_csv(make_row('bob'), csv_path)
+
+    with open(csv_path) as f:
+        field_counts = {line.count(',') for line in f}
+    assert len(field_counts) == 1
+
+    df = fn.read_from_csv(csv_path)
+    assert df.loc[df['user_id'] == 'alice', 'tax_payable'].iloc[0] == 3425.0
+    assert df.loc[df['user_id'] == 'bob', 'tax_band_E'].isna().all()
+
+
+def test_duplicate_registration_resolves_false(csv_path):
+    with fn.BatchedCSVWriter(csv_path) as writer:
+        # Duplicate within one batch
+        first = writer.submit_registration(make_row('alice'))
+        second = writer.submit_registration(make_row('alice'))
+        assert first.result(timeout=5) is True
+        assert second.result(timeout=5) is False
+
+        # Duplicate of a user already in the file
+        assert writer.submit_registration(make_row('alice')).result(timeout=5) is False
+
+    assert len(fn.read_from_csv(csv_path)) == 1
+
+
+def test_flushes_on_count_limit(csv_path):
+    with fn.BatchedCSVWriter(csv_path, max_batch=3, max_delay=60) as writer:
+        futures = [writer.submit_registration(make_row(f'u{i}')) for i in range(3)]
+        assert [f.result(timeout=5) for f in futures] == [True, True, True]
+
+
+def test_flushes_on_time_window(csv_path):
+    with fn.BatchedCSVWriter(csv_path, max_batch=100, max_delay=0.05) as writer:
+        assert writer.submit_registration(make_row('alice')).result(timeout=5) is True
+
+
+def test_flush_writes_pending_items(csv_path):
+    with fn.BatchedCSVWriter(csv_path, max_batch=100, max_delay=60) as writer:
+        futures = [writer.submit_registration(make_row(f'u{i}')) for i in range(5)]
+        writer.flush()
+        assert all(f.done() for f in futures)
+        assert len(fn.read_from_csv(csv_path)) == 5
+
+
+def test_flush_drains_more_than_max_batch(csv_path):
+    with fn.BatchedCSVWriter(csv_path, max_batch=2, max_delay=60) as writer:
+        futures = [writer.submit_registration(make_row(f'u{i}')) for i in range(7)]
+        start = time.monotonic()
+        writer.flush()
+        assert time.monotonic() - start < 5
+        assert all(f.done() for f in futures)
+        assert len(fn.read_from_csv(csv_path)) == 7
+
+
+def test_close_writes_pending_items(csv_path):
+    writer = fn.BatchedCSVWriter(csv_path, max_batch=100, max_delay=60)
+    futures = [writer.submit_registration(make_row(f'u{i}')) for i in range(5)]
+    futures.append(writer.submit_update('u0', make_row('u0', 100.0)))
+    writer.close()
+
+    assert [f.result(timeout=0) for f in futures] == [True] * 6
+    df = fn.read_from_csv(csv_path)
+    assert len(df) == 5
+    assert df.loc[df['user_id'] == 'u0', 'annual_income'].iloc[0] == 100.0
+    with pytest.raises(RuntimeError):
+        writer.submit_registration(make_row('late'))
+
+
+def test_batch_matches_sequential_writes(tmp_path):
+    sequential_path = str(tmp_path / "sequential.csv")
+    batched_path = str(tmp_path / "batched.csv")
+
+    rng = random.Random(0)
+    operations = []
+    registered = []
+    for i in range(200):
+        if registered and rng.random() < 0.5:
+            user_id = rng.choice(registered)
+            operations.append(('update', user_id, make_row(user_id, float(i))))
+        else:
+            user_id = f'u{i}'
+            registered.append(user_id)
+            operations.append(('register', user_id, make_row(user_id)))
+
+    for kind, user_id, data in operations:
+        if kind == 'register':
+            assert fn.save_to_csv(data, sequential_path)
+        else:
+            assert fn.update_user_record(user_id, data, sequential_path)
+
+    with fn.BatchedCSVWriter(batched_path, max_batch=16) as writer:
+        futures = []
+        for kind, user_id, data in operations:
+            if kind == 'register':
+                futures.append(writer.submit_registration(data))
+            else:
+                futures.append(writer.submit_update(user_id, data))
+        assert all(f.result(timeout=5) for f in futures)
+
+    with open(sequential_path) as f, open(batched_path) as g:
+        assert f.read() == g.read()
+
+
+def test_write_error_resolves_false(csv_path, monkeypatch):
+    def fail(batch, filename):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(fn, '_write_batch', fail)
+    with fn.BatchedCSVWriter(csv_path) as writer:
+        assert writer.submit_registration(make_row('alice')).result(timeout=5) is False
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_writer_stopping_fails_pending_futures(csv_path, monkeypatch):
+    def stop(batch, filename):
+        raise SystemExit
+
+    monkeypatch.setattr(fn, '_write_batch', stop)
+    writer = fn.BatchedCSVWriter(csv_path)
+    future = writer.submit_registration(make_row('alice'))
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    writer.close()